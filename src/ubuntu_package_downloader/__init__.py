@@ -1,18 +1,17 @@
 import argparse
 import sys
 
-from .config import Settings
-from .ubuntu_package_downloader import UbuntuPackageDownloader
+from .config import get_settings
 
 SUCCESS = 0
 ERROR = 1
 
-def main():
+def _build_parser() -> argparse.ArgumentParser:
     """
-    Process command line arguments and call ubuntu_package_downloader function
+    Build the command line argument parser
     """
     # load settings
-    settings = Settings()
+    settings = get_settings()
 
     parser = argparse.ArgumentParser(
         prog=settings.project.name, description=settings.project.description
@@ -54,13 +53,32 @@ def main():
         "--depth",
         type=int,
         default=1,
-        required=(
-            "-w" in sys.argv and "--depth" in sys.argv
-        ),  # only required if -w specified, and user specified it, so that default can be used
         help="Set the dependency recursion depth, defaults to 1",
     )
+    parser.add_argument(
+        "--skip-installed",
+        action="store_true",
+        help="Do not download dependencies already installed on this host",
+    )
+    return parser
+
+
+# built once at import, so repeated in-process invocations reuse it
+_PARSER = _build_parser()
+
+
+def main():
+    """
+    Process command line arguments and call ubuntu_package_downloader function
+    """
+    # load settings
+    settings = get_settings()
+
     # parse arguments
-    args = parser.parse_args()
+    args = _PARSER.parse_args()
+
+    # imported after parsing, so --help and --version do not load launchpadlib and python-debian
+    from .ubuntu_package_downloader import UbuntuPackageDownloader
 
     # get UbuntuPackageDownloader instance
     upd = UbuntuPackageDownloader(
@@ -70,13 +88,12 @@ def main():
         settings.launchpad.distribution,
     )
 
-    # set recursion limit
-    upd.recursion_limit = args.depth
-
     return sys.exit(SUCCESS) if upd.download(
         package_name=args.name,
         package_version=args.package_version,
         distribution_series=args.distribution_series,
         architecture=args.architecture,
         with_dependencies=args.with_dependencies,
+        recursion_limit=args.depth,
+        skip_installed=args.skip_installed,
     ) else sys.exit(ERROR)
@@ -0,0 +1,167 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+from threading import RLock
+from typing import Optional
+
+from loguru import logger
+
+
+def cache_directory(name: str = "ubuntu-package-downloader") -> Path:
+    """Get the user cache directory, following the XDG base directory specification"""
+
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / name
+
+
+class JsonFileCache:
+    """
+    Persistent cache of entries stored in a json file.
+    Entries are loaded on first use and written back on save, if changed.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._entries = None
+        self._dirty = False
+        self._lock = RLock()
+
+    def _load(self) -> dict:
+        """
+        Load cache entries from disk, an unreadable cache is treated as empty
+        Loaded on first use, so runs that never use the cache never read it.
+        """
+
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._read(self.path)
+            return self._entries
+
+    @staticmethod
+    def _read(path: Path) -> dict:
+        """Read cache entries from a file"""
+
+        try:
+            with path.open() as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable cache {}: {}", path, e)
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _set(self, key: str, entry: dict):
+        """Set a cache entry"""
+
+        with self._lock:
+            self._load()[key] = entry
+            self._dirty = True
+
+    def _is_live(self, key: str, entry: dict) -> bool:
+        """Whether an entry is still valid, invalid entries are dropped when the cache is saved"""
+
+        return True
+
+    def save(self):
+        """Write the cache to disk if it has changed, failures are logged rather than raised"""
+
+        with self._lock:
+            if not self._dirty:
+                return
+            # drop entries that are no longer valid, so the cache does not grow unbounded
+            self._entries = {
+                key: entry
+                for key, entry in self._entries.items()
+                if self._is_live(key, entry)
+            }
+            partial_path = None
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                # each save writes a uniquely named partial file, so concurrent runs never write to the same file,
+                # the last run to replace the cache wins
+                with tempfile.NamedTemporaryFile(
+                    "w",
+                    dir=self.path.parent,
+                    prefix=f"{self.path.name}.",
+                    suffix=".part",
+                    delete=False,
+                ) as f:
+                    partial_path = f.name
+                    json.dump(self._entries, f)
+                os.replace(partial_path, self.path)
+                self._dirty = False
+            except OSError as e:
+                if partial_path is not None:
+                    Path(partial_path).unlink(missing_ok=True)
+                logger.warning("Could not write cache {}: {}", self.path, e)
+
+
+class DependencyCache(JsonFileCache):
+    """
+    Persistent cache of the dependencies of downloaded package binaries.
+    Entries are keyed by the binary's absolute path and are only valid while its modification time and size are unchanged.
+    """
+
+    def get(self, debian_binary: Path) -> Optional[list[str]]:
+        """Get the cached dependencies of a package binary, or None if not cached or stale"""
+
+        stat = debian_binary.stat()
+        entry = self._load().get(str(debian_binary.absolute()))
+        if (
+            entry is None
+            or entry.get("mtime") != stat.st_mtime_ns
+            or entry.get("size") != stat.st_size
+        ):
+            return None
+        return entry["depends"]
+
+    def set(self, debian_binary: Path, dependencies: list[str]):
+        """Cache the dependencies of a package binary"""
+
+        stat = debian_binary.stat()
+        self._set(
+            str(debian_binary.absolute()),
+            {
+                "mtime": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "depends": dependencies,
+            },
+        )
+
+    def _is_live(self, key: str, entry: dict) -> bool:
+        """Entries of binaries that have since been removed are invalid"""
+
+        return os.path.exists(key)
+
+
+class BinaryUrlCache(JsonFileCache):
+    """
+    Persistent cache of the binary file urls of published packages.
+    Only lookups of a specific package version are cached, the files of a published version do not change,
+    so entries never expire.
+    """
+
+    @staticmethod
+    def key(*lookup: str) -> str:
+        """Build the cache key of a package lookup, i.e., from its service root, distribution, series, architecture, name and version"""
+
+        return " ".join(lookup)
+
+    def get(self, key: str) -> Optional[list[str]]:
+        """Get the cached binary file urls of a package lookup, or None if not cached"""
+
+        entry = self._load().get(key)
+        if entry is None or not self._is_live(key, entry):
+            return None
+        return entry["urls"]
+
+    def set(self, key: str, urls: list[str]):
+        """Cache the binary file urls of a package lookup"""
+
+        self._set(key, {"urls": urls})
+
+    def _is_live(self, key: str, entry: dict) -> bool:
+        """Entries of latest version lookups, written by earlier versions of this tool, are invalid"""
+
+        return not entry.get("latest")
@@ -1,4 +1,4 @@
-from pydantic import Field
+from pydantic import BaseModel, ConfigDict, Field
 from pydantic_settings import (
     SettingsConfigDict,
     BaseSettings,
@@ -8,43 +8,65 @@ from pydantic_settings import (
 )
 from uuid import uuid4
 from pathlib import Path
+from functools import lru_cache, cache
+from dataclasses import dataclass
+from typing import Any, Self
 
-class ProjectSettings(BaseSettings):
-    """Project related settings."""
 
-    model_config = SettingsConfigDict(
-        pyproject_toml_depth=2,
-        pyproject_toml_table_header=("project",),
-        extra="ignore",
-    )
+@cache
+def _file_settings_source(
+    source_cls: type[PydanticBaseSettingsSource], settings_cls: type[BaseSettings]
+) -> PydanticBaseSettingsSource:
+    """
+    Get a file backed settings source.
+    The file is read and parsed once on first use, the source is then reused for every settings construction.
+    """
+    return source_cls(settings_cls)
 
-    @classmethod
-    def settings_customise_sources(
-        cls,
-        settings_cls: type[BaseSettings],
-        init_settings: PydanticBaseSettingsSource,
-        env_settings: PydanticBaseSettingsSource,
-        dotenv_settings: PydanticBaseSettingsSource,
-        file_secret_settings: PydanticBaseSettingsSource,
-    ) -> tuple[PydanticBaseSettingsSource, ...]:
-        return (
-            env_settings,
-            dotenv_settings,
-            PyprojectTomlConfigSettingsSource(settings_cls),
-            init_settings,
-        )
+
+class _ProjectTableSettingsSource(PyprojectTomlConfigSettingsSource):
+    """
+    Settings source of the pyproject.toml [project] table.
+    Only the [project] table is read, nested under the project settings, so no other pyproject.toml table can populate settings.
+    """
+
+    def __call__(self) -> dict[str, Any]:
+        return {"project": super().__call__()} if self.toml_data else {}
+
+
+class ProjectSettings(BaseModel):
+    """Project related settings."""
+
+    model_config = ConfigDict(extra="ignore")
 
     name: str = Field(frozen=True, default="ubuntu-package-downloader")
     version: str = Field(frozen=True, default="0.0.0")
     description: str = Field(frozen=True, default="A command line utility to support downloading Ubuntu packages from Launchpad.")
 
 
-class LaunchpadSettings(BaseSettings):
+class LaunchpadSettings(BaseModel):
     """Configuration settings for Ubuntu Package Downloader."""
 
+    consumer_name: str = Field(frozen=True, default=str(uuid4()))
+    service_root: str = Field(frozen=True)
+    version: str = Field(frozen=True)
+    distribution: str = Field(frozen=True)
+
+
+class Settings(BaseSettings):
+    """
+    Application settings.
+    Project settings are read from the pyproject.toml [project] table and launchpad settings from the config.yml launchpad section, in a single pass of sources.
+    """
+
     model_config = SettingsConfigDict(
+        # only the pyproject.toml [project] table is read, it populates the project settings
+        pyproject_toml_depth=2,
+        pyproject_toml_table_header=("project",),
+        # the whole config.yml is read, its launchpad section populates the launchpad settings
         yaml_file=Path(__file__).parent / "config.yml",
-        yaml_config_section="launchpad",
+        env_nested_delimiter="__",
+        extra="ignore",
     )
 
     @classmethod
@@ -59,20 +81,60 @@ class LaunchpadSettings(BaseSettings):
         return (
             env_settings,
             dotenv_settings,
-            YamlConfigSettingsSource(settings_cls),
+            _file_settings_source(_ProjectTableSettingsSource, settings_cls),
+            _file_settings_source(YamlConfigSettingsSource, settings_cls),
             init_settings,
         )
 
-    consumer_name: str = Field(frozen=True, default=str(uuid4()))
-    service_root: str = Field(frozen=True)
-    version: str = Field(frozen=True)
-    distribution: str = Field(frozen=True)
+    project: ProjectSettings = Field(default_factory=ProjectSettings)
+    launchpad: LaunchpadSettings
 
 
-class Settings(BaseSettings):
-    project: ProjectSettings = Field(default_factory=ProjectSettings)
-    launchpad: LaunchpadSettings = Field(default_factory=LaunchpadSettings)
+@dataclass(frozen=True, slots=True)
+class ProjectConfig:
+    """Loaded project settings."""
+
+    name: str
+    version: str
+    description: str
+
+
+@dataclass(frozen=True, slots=True)
+class LaunchpadConfig:
+    """Loaded launchpad settings."""
+
+    consumer_name: str
+    service_root: str
+    version: str
+    distribution: str
+
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """
+    Loaded application settings.
+    Pydantic validates the settings once when loading, the rest of the application reads these plain frozen values.
+    """
+
+    project: ProjectConfig
+    launchpad: LaunchpadConfig
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> Self:
+        return cls(
+            project=ProjectConfig(**settings.project.model_dump()),
+            launchpad=LaunchpadConfig(**settings.launchpad.model_dump()),
+        )
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Config:
+    """
+    Get the application settings.
+    Loaded once and shared, all fields are frozen so the instance is safe to reuse.
+    """
+    return Config.from_settings(Settings())
 
 
 if __name__ == "__main__":
-    print(Settings.model_validate({}))
+    print(get_settings())
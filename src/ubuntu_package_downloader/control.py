@@ -0,0 +1,190 @@
+import mmap
+import re
+import shutil
+import subprocess
+import tarfile
+from functools import cache
+from io import BytesIO
+from pathlib import Path
+from typing import Iterable, Optional, TYPE_CHECKING
+
+from loguru import logger
+
+# python-debian is slow to import, so is imported where first used
+if TYPE_CHECKING:
+    from debian.debfile import DebControl
+
+# a debian binary is an ar archive, of a debian-binary version member, a control.tar.* member and a data.tar.* member
+# https://manpages.ubuntu.com/manpages/noble/man5/deb.5.html
+AR_MAGIC = b"!<arch>\n"
+AR_HEADER_SIZE = 60
+CONTROL_MEMBER_PREFIX = b"control.tar"
+CONTROL_FILENAMES = ("./control", "control")
+
+# first package name of each comma separated relation in a dependency field
+# alternatives (after '|'), version constraints and architecture qualifiers are not captured
+DEPENDENCY_NAME_PATTERN = re.compile(r"(?:^|,)\s*([a-z0-9][a-z0-9+\-.]*)")
+
+
+def _read_control_member(archive: mmap.mmap) -> bytes:
+    """Read the control archive member of a memory mapped ar archive, without reading any other member"""
+
+    if archive[: len(AR_MAGIC)] != AR_MAGIC:
+        raise ValueError("Not an ar archive")
+
+    offset = len(AR_MAGIC)
+    while offset + AR_HEADER_SIZE <= len(archive):
+        header = archive[offset : offset + AR_HEADER_SIZE]
+        offset += AR_HEADER_SIZE
+        # the member name is space padded, and may be terminated with a '/'
+        name = header[0:16].rstrip(b" ").rstrip(b"/")
+        size = int(header[48:58])
+        if name.startswith(CONTROL_MEMBER_PREFIX):
+            return archive[offset : offset + size]
+        # members are aligned to even offsets
+        offset += size + size % 2
+
+    raise ValueError("No control archive member found")
+
+
+def read_control(debian_binary: Path) -> Optional[str]:
+    """
+    Read the control file of a debian binary.
+    Only the control archive is read, the data archive is never touched.
+    Returns None if the control archive compression is not supported by tarfile, i.e., zstd before python 3.14.
+    """
+
+    # the binary is memory mapped, so only the pages of the ar headers and control archive are read from disk
+    with debian_binary.open("rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as archive:
+        control_member = _read_control_member(archive)
+
+    try:
+        with tarfile.open(fileobj=BytesIO(control_member), mode="r|*") as control_archive:
+            for member in control_archive:
+                if member.name in CONTROL_FILENAMES:
+                    return control_archive.extractfile(member).read().decode()
+    except (tarfile.CompressionError, tarfile.ReadError):
+        return None
+
+    raise ValueError("No control file found in control archive")
+
+
+@cache
+def _dpkg_deb() -> Optional[str]:
+    """Locate the dpkg-deb executable, present on any debian based host"""
+
+    return shutil.which("dpkg-deb")
+
+
+def _read_dpkg_deb_field(debian_binary: Path, field: str) -> Optional[str]:
+    """
+    Read a control file field of a debian binary with dpkg-deb.
+    Returns None if dpkg-deb is not available or fails to read the binary.
+    """
+
+    dpkg_deb = _dpkg_deb()
+    if dpkg_deb is None:
+        return None
+
+    result = subprocess.run(
+        [dpkg_deb, "--field", str(debian_binary), field],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        logger.debug(
+            "dpkg-deb could not read {}: {}", debian_binary, result.stderr.strip()
+        )
+        return None
+    return result.stdout
+
+
+@cache
+def _dpkg_query() -> Optional[str]:
+    """Locate the dpkg-query executable, present on any debian based host"""
+
+    return shutil.which("dpkg-query")
+
+
+def read_installed(package_names: Iterable[str], architecture: str) -> set[str]:
+    """
+    Find which of the named packages are installed on this host, for an architecture, with dpkg-query.
+    Architecture independent (all) packages are installed for every architecture.
+    Returns an empty set if dpkg-query is not available, i.e., on a non debian based host.
+    """
+
+    package_names = list(package_names)
+    dpkg_query = _dpkg_query()
+    if dpkg_query is None or not package_names:
+        return set()
+
+    # every package is queried in one process, packages dpkg does not know of are reported on stderr,
+    # with a non-zero exit status, but the known packages are still listed
+    result = subprocess.run(
+        [
+            dpkg_query,
+            "--show",
+            "--showformat=${Package}\t${Architecture}\t${Status}\n",
+            *package_names,
+        ],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    installed = set()
+    for line in result.stdout.splitlines():
+        name, package_architecture, status = line.split("\t")
+        # the status is of the form 'install ok installed', the last word is the package state
+        if package_architecture in (architecture, "all") and status.endswith(
+            " installed"
+        ):
+            installed.add(name)
+    return installed
+
+
+def _read_debfile_control(debian_binary: Path) -> str:
+    """Read the control file of a debian binary with python-debian"""
+
+    from debian.debfile import DebFile
+
+    # load the debian file binary (this is muiltiple tar.gz's tarred together)
+    deb_file = DebFile(debian_binary)
+
+    # get the control archive from the deb file
+    control_archive: "DebControl" = deb_file.control
+
+    # read the control file data
+    return control_archive.get_content("control")
+
+
+def read_dependencies(debian_binary: Path) -> list[str]:
+    """
+    Parse debian binary file to extract dependency package names
+    A module level function of the binary path only, so it can be run in any worker.
+    """
+
+    # get the dependencies string
+    # this is a ill formatted sentence of the form 'libc6 (>= 2.34), libx11-6, libxmu6 (>= 2:1.1.3)'
+    # additionally this field is optional https://www.debian.org/doc/debian-policy/ch-relationships.html#s-binarydeps
+    # the control file is read in process where possible, as it is the fastest,
+    # zstd control archives (before python 3.14) are read with the native dpkg-deb, if available,
+    # otherwise with python-debian, which decompresses zstd with an external unzstd process
+    control_file_data = read_control(debian_binary)
+    if control_file_data is None:
+        dependencies_str = _read_dpkg_deb_field(debian_binary, "Depends")
+        if dependencies_str is None:
+            control_file_data = _read_debfile_control(debian_binary)
+    if control_file_data is not None:
+        from debian.deb822 import Deb822
+
+        # parse the control file data
+        dependencies_str = Deb822(control_file_data).get("Depends", "")
+    logger.debug("Raw dependencies string: {}", dependencies_str)
+
+    # extract dependency names (without version constraints)
+    dependencies_list = DEPENDENCY_NAME_PATTERN.findall(dependencies_str)
+
+    return dependencies_list
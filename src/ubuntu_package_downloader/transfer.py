@@ -0,0 +1,80 @@
+import http.client
+import threading
+from typing import BinaryIO
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+from urllib.request import getproxies, proxy_bypass, urlopen
+
+# status codes followed as redirects, launchpad +files urls redirect to the librarian
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+
+class ConnectionPool:
+    """
+    Persistent http(s) connections, one set per thread.
+    Consecutive downloads on a worker thread reuse their TCP and TLS connection to each host,
+    rather than paying the handshakes for every file.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _connection(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        """Get this thread's connection to a host, connecting on first use"""
+
+        connections = self._local.__dict__.setdefault("connections", {})
+        key = (scheme, netloc)
+        if key not in connections:
+            connection_cls = (
+                http.client.HTTPSConnection
+                if scheme == "https"
+                else http.client.HTTPConnection
+            )
+            connections[key] = connection_cls(netloc)
+        return connections[key]
+
+    def _request(self, url: str) -> http.client.HTTPResponse:
+        """Request a url on a pooled connection, reconnecting once if the kept alive connection is unusable"""
+
+        parts = urlsplit(url)
+        target = parts.path or "/"
+        if parts.query:
+            target = f"{target}?{parts.query}"
+
+        connection = self._connection(parts.scheme, parts.netloc)
+        try:
+            connection.request("GET", target)
+            return connection.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            # the server closed the idle connection, or a previous response was abandoned part read,
+            # retry on a new connection
+            connection.close()
+            connection.request("GET", target)
+            return connection.getresponse()
+
+    def open(self, url: str) -> BinaryIO:
+        """
+        Open a url for reading, following redirects
+        The response must be read to the end for its connection to be reused.
+        Requests that would go through a proxy are made with urllib instead, which handles proxies but not connection reuse.
+        """
+
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            if parts.scheme in getproxies() and not proxy_bypass(parts.hostname):
+                return urlopen(url)
+
+            response = self._request(url)
+            if response.status in REDIRECT_STATUSES:
+                # drain the redirect body, so the connection can be reused
+                response.read()
+                url = urljoin(url, response.getheader("Location"))
+                continue
+            if response.status >= 400:
+                # drain the error body, so the connection can be reused
+                response.read()
+                raise HTTPError(url, response.status, response.reason, response.headers, None)
+            return response
+
+        raise HTTPError(url, response.status, "Too many redirects", response.headers, None)
@@ -1,12 +1,50 @@
 from pathlib import Path
-from launchpadlib.launchpad import Launchpad
-from launchpadlib.uris import service_roots
 from loguru import logger
-from typing import Optional, Annotated, Self
-from debian.debfile import DebFile, DebControl
-from debian.deb822 import Deb822
-from functools import reduce
-import operator
+from typing import Optional, Annotated, Self, TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain
+import os
+import threading
+from .cache import BinaryUrlCache, DependencyCache, cache_directory
+from .control import read_dependencies, read_installed
+from .transfer import ConnectionPool
+
+# launchpadlib is slow to import, so is imported where first used
+if TYPE_CHECKING:
+    from launchpadlib.launchpad import Launchpad
+
+# maximum number of package binaries downloaded concurrently
+DOWNLOAD_WORKERS = 8
+
+# size of the chunks, and write buffer, package binaries are streamed to disk with
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+
+@lru_cache(maxsize=4096)
+def _url_filename(url: str) -> Path:
+    """Get the local filename a binary url is downloaded to"""
+
+    return Path(url.rsplit("/", 1)[-1])
+
+
+def _validate_recursion_limit(depth: int) -> int:
+    """Check a maximum recursion depth for dependency downloading is valid"""
+
+    if depth < 0:
+        raise ValueError("Recursion depth cannot be negative")
+    return depth
+
+
+_download_buffers = threading.local()
+
+
+def _download_buffer() -> memoryview:
+    """Get this thread's download buffer, allocated once per download worker and reused for every binary"""
+
+    if not hasattr(_download_buffers, "buffer"):
+        _download_buffers.buffer = memoryview(bytearray(DOWNLOAD_CHUNK_SIZE))
+    return _download_buffers.buffer
 
 
 class UbuntuPackageDownloader:
@@ -26,6 +64,13 @@ class UbuntuPackageDownloader:
         )
         self.distribution = self._configure_distribution(self._lp_distribution)
         self.archive = self._configure_archive()
+        self._arch_series = {}
+        self.dependency_cache = DependencyCache(cache_directory() / "deps.json")
+        self.binary_url_cache = BinaryUrlCache(cache_directory() / "binary-urls.json")
+        self.connections = ConnectionPool()
+        self._downloaded: set[Path] = set()
+        self._existing: set[Path] = set()
+        self._installed: dict[tuple[str, str], bool] = {}
         self.__recursion_limit = 1
 
     @property
@@ -36,20 +81,20 @@ class UbuntuPackageDownloader:
     @recursion_limit.setter
     def recursion_limit(self, depth: int):
         """Set maximum recursion depth for dependency downloading"""
-        if depth < 0:
-            raise ValueError("Recursion depth cannot be negative")
-        self.__recursion_limit = depth
+        self.__recursion_limit = _validate_recursion_limit(depth)
 
     def _login_launchpad(
         self, lp_consumer_name: str, lp_service_root: str, lp_version: str
-    ) -> Launchpad:
+    ) -> "Launchpad":
         """Login anonymously to launchpad"""
 
-        msg = f"Logging in to Launchpad as anonymous user {lp_consumer_name}"
-        logger.debug(msg)
+        from launchpadlib.launchpad import Launchpad
+
+        # the service root is resolved by launchpadlib, it may be an alias (production, staging, ...) or a url
+        logger.debug("Logging in to Launchpad as anonymous user {}", lp_consumer_name)
         return Launchpad.login_anonymously(
             lp_consumer_name,
-            service_root=service_roots[lp_service_root],
+            service_root=lp_service_root,
             version=lp_version,
         )
 
@@ -62,164 +107,335 @@ class UbuntuPackageDownloader:
         Requires Launchpad API class to be set.
         """
 
-        msg = f"Selecting {lp_distribution} distribution"
-        logger.debug(msg)
+        logger.debug("Selecting {} distribution", lp_distribution)
         return self.lp.distributions[lp_distribution]
 
     def _configure_archive(self):
         """Select main archive"""
 
-        msg = f"Selecting main archive"
-        logger.debug(msg)
+        logger.debug("Selecting main archive")
         return self.distribution.main_archive
 
+    def _configure_arch_series(self, distribution_series: str, architecture: str):
+        """
+        Select distribution series and architecture series
+        Cached per series and architecture, as these are fixed for every package of a download.
+        """
+
+        key = (distribution_series, architecture)
+        if key not in self._arch_series:
+            logger.debug("Selecting {} {} series", distribution_series, architecture)
+            lp_series = self.distribution.getSeries(name_or_version=distribution_series)
+            lp_arch_series = lp_series.getDistroArchSeries(archtag=architecture)
+            self._arch_series[key] = (lp_series, lp_arch_series)
+        return self._arch_series[key]
+
+    def _installed_packages(
+        self, package_names: set[str], architecture: str
+    ) -> set[str]:
+        """
+        Find which of the named packages are installed on this host, for an architecture
+        Cached per package, so dpkg is queried at most once for each package, and once for each dependency level.
+        """
+
+        unknown_package_names = {
+            package_name
+            for package_name in package_names
+            if (package_name, architecture) not in self._installed
+        }
+        if unknown_package_names:
+            installed = read_installed(unknown_package_names, architecture)
+            self._installed.update(
+                ((package_name, architecture), package_name in installed)
+                for package_name in unknown_package_names
+            )
+        return {
+            package_name
+            for package_name in package_names
+            if self._installed[(package_name, architecture)]
+        }
+
     def identify_package_dependencies(self, debian_binary: Path) -> list[str]:
         """Parse debian binary file to extract dependencies"""
 
         if not debian_binary.exists():
-            msg = f"Debian binary file {debian_binary} does not exist"
-            logger.error(msg)
+            logger.error("Debian binary file {} does not exist", debian_binary)
             return []
 
-        # load the debian file binary (this is muiltiple tar.gz's tarred together)
-        deb_file = DebFile(debian_binary)
+        # reuse the dependencies of a previously parsed binary, if it is unchanged
+        dependencies_list = self.dependency_cache.get(debian_binary)
+        if dependencies_list is not None:
+            logger.debug("Using cached dependencies of {}", debian_binary)
+            return dependencies_list
 
-        # get the control archive from the deb file
-        control_archive: DebControl = deb_file.control
+        dependencies_list = read_dependencies(debian_binary)
+        self.dependency_cache.set(debian_binary, dependencies_list)
 
-        # read the control file data
-        control_file_data = control_archive.get_content("control")
+        return dependencies_list
 
-        # parse the control file data
-        control_dict = Deb822(control_file_data)
+    def _download_package_binary_dependencies(
+        self, url: str, identify_dependencies: bool
+    ) -> tuple[Path, list[str]]:
+        """
+        Download binary file from URL, then parse its dependencies if required
+        Run as one task, so a binary is parsed while the other binaries of its level are still downloading.
+        """
 
-        # get the dependencies string
-        # this is a ill formatted sentence of the form 'libc6 (>= 2.34), libx11-6, libxmu6 (>= 2:1.1.3)'
-        # additionally this field is optional https://www.debian.org/doc/debian-policy/ch-relationships.html#s-binarydeps
-        dependencies_str = control_dict.get("Depends", "")
-        logger.debug(f"Raw dependencies string: {dependencies_str}")
+        binary_filename = self.download_package_binary(url)
+        if not identify_dependencies:
+            return binary_filename, []
+        return binary_filename, self.identify_package_dependencies(binary_filename)
 
-        # extract dependency names (without version constraints)
-        dependency_list = [
-            dependency.strip() for dependency in dependencies_str.split(",")
-        ]
-        dependencies_list = [
-            dependency.split(" ")[0].strip() for dependency in dependency_list
-        ]
+    def _scan_existing_binaries(self):
+        """
+        Find the files already in the download directory
+        One directory scan replaces an existence check per binary.
+        Every file is included, as binaries are not only .deb files, e.g., .udeb and .ddeb files.
+        The scan is rebuilt on each download, so files removed since a previous download are fetched again.
+        """
 
-        return dependencies_list
+        with os.scandir() as entries:
+            self._existing = {Path(entry.name) for entry in entries if entry.is_file()}
+        self._downloaded &= self._existing
 
     def download_package_binary(self, url: str) -> Path:
-        """Download binary file from URL"""
-
-        binary_filename = Path(Path(url).name)
-        msg = f"Downloading {url} to {binary_filename}."
-        logger.debug(msg)
+        """
+        Download binary file from URL
+        Binaries are public librarian files, they are fetched outside of the launchpad client so that downloads can run concurrently,
+        each download worker reuses its connections for the binaries it downloads.
+        """
 
-        if binary_filename.exists():
-            msg = f"{binary_filename} already exists. Skipping re-download."
-            logger.warning(msg)
+        binary_filename = _url_filename(url)
+        logger.debug("Downloading {} to {}.", url, binary_filename)
+
+        # binaries downloaded by this downloader, or found by scanning the download directory,
+        # are known to exist without checking the filesystem per binary
+        if binary_filename in self._downloaded:
+            logger.debug(
+                "{} already downloaded. Skipping re-download.", binary_filename
+            )
+        elif binary_filename in self._existing:
+            logger.warning("{} already exists. Skipping re-download.", binary_filename)
         else:
-            binary_filename.write_bytes(self.lp._browser.get(url))
-            msg = f"Sucessfully downloaded {url} to {binary_filename}."
-            logger.debug(msg)
-
+            # stream to a partial file, so an interrupted download is not mistaken for a complete one
+            partial_filename = f"{binary_filename}.part"
+            with self.connections.open(url) as response, open(
+                partial_filename, "wb", buffering=DOWNLOAD_CHUNK_SIZE
+            ) as f:
+                # the response is read into a reused buffer, rather than allocating a new bytes object per chunk,
+                # chunks as large as the write buffer are written straight through to the file
+                buffer = _download_buffer()
+                while size := response.readinto(buffer):
+                    f.write(buffer[:size])
+                f.flush()
+                # the binary is only wanted on disk, so drop its pages from the page cache
+                # dirty pages are not dropped, so the binary is written out first, which also means
+                # a binary is complete on disk before it replaces any previous file
+                if hasattr(os, "posix_fadvise"):
+                    os.fdatasync(f.fileno())
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+            os.replace(partial_filename, binary_filename)
+            logger.debug("Sucessfully downloaded {} to {}.", url, binary_filename)
+
+        self._downloaded.add(binary_filename)
         return binary_filename
 
-    def download(
-        self,
-        package_name: str,
-        package_version: str,
-        distribution_series: str,
-        architecture: str,
-        with_dependencies: bool,
+    def find_package_binary_urls(
+        self, package_name: str, package_version: str, lp_series, lp_arch_series
     ) -> Annotated[
         Optional[list[str]],
-        "List of downloaded package filenames or None if not found or none downloaded",
+        "List of package binary urls or None if the package could not be found",
     ]:
+        """
+        Look up the binary file urls of a package in the archive
+        Lookups of specific versions are cached on disk.
+        Latest version lookups are never cached, so a newly published version, e.g., a security update, is always found.
+        """
+
+        cache_key = None
+        if package_version != "latest":
+            cache_key = BinaryUrlCache.key(
+                self._lp_service_root,
+                self._lp_distribution,
+                lp_series.name,
+                lp_arch_series.architecture_tag,
+                package_name,
+                package_version,
+            )
+            package_binary_urls = self.binary_url_cache.get(cache_key)
+            if package_binary_urls is not None:
+                logger.debug(
+                    "Using cached binary urls of {}@{} package",
+                    package_name,
+                    package_version,
+                )
+                return package_binary_urls
+
         # get the binary publishing history for the package
-        msg = f"Fetching binary publishing history for {package_name}@{package_version} package"
-        logger.debug(msg)
-        lp_series = self.distribution.getSeries(name_or_version=distribution_series)
-        lp_arch_series = lp_series.getDistroArchSeries(archtag=architecture)
+        # only the latest record is needed, slicing it from the page returned by the lookup avoids
+        # the additional request a length check makes to fetch the collection size
+        logger.debug(
+            "Fetching binary publishing history for {}@{} package",
+            package_name,
+            package_version,
+        )
         binary_publishing_histories = self.archive.getPublishedBinaries(
             exact_match=True,
             version=None if package_version == "latest" else package_version,
             binary_name=package_name,
             order_by_date=True,
             distro_arch_series=lp_arch_series,
-        )
+        )[:1]
 
         if not binary_publishing_histories:
-            msg = f"No binary publishing history found for {package_name} {package_version} in {lp_series.name} {lp_arch_series.architecture_tag}."
-            logger.error(msg)
+            logger.error(
+                "No binary publishing history found for {} {} in {} {}.",
+                package_name,
+                package_version,
+                lp_series.name,
+                lp_arch_series.architecture_tag,
+            )
             return None
 
         # select latest result (though there should be only one with exact_match=True)
         binary_publishing_history = binary_publishing_histories[0]
-        binary_build_link = binary_publishing_history.build_link
-        try:
-            binary_build = self.lp.load(binary_build_link)
-            msg = f"Found binary package {package_name} {lp_arch_series.architecture_tag} version {package_version} in {lp_arch_series.display_name} build."
-            logger.debug(msg)
-        except ValueError:
-            msg = f"Could not load binary build link {binary_build_link}."
-            logger.error(msg)
-            return None
+        # the build is not loaded, its architecture is that of the arch series searched,
+        # so it would only cost another request
+        logger.debug(
+            "Found binary package {} {} version {} in {} build.",
+            package_name,
+            lp_arch_series.architecture_tag,
+            package_version,
+            lp_arch_series.display_name,
+        )
 
-        # download package binary from their urls
         # a package may have multiple binary files
-        msg = f"Downloading package {package_name} version {package_version} for {lp_series.name} {binary_build.arch_tag}."
-        logger.debug(msg)
-        downloaded_binary_build_filenames = [
-            self.download_package_binary(package_binary_url)
-            for package_binary_url in binary_publishing_history.binaryFileUrls()
-        ]
-
-        # parse the deb file to get its dependencies
-        # in order to determine dependencies, the file must be downloaded first, meanting this is a serial process
-        dependencies = [
-            self.identify_package_dependencies(d)
-            for d in downloaded_binary_build_filenames
-        ]
-        dependencies = reduce(operator.concat, dependencies)
-        dependencies = set(dependencies)
-
-        # check whether to download dependencies
-        if with_dependencies:
-            # check whether maximum recursion depth reached
-            if 0 >= self.__recursion_limit:
-                msg = f"Maximum dependency recursion depth reached. Not downloading dependencies of {package_name}."
-                logger.debug(msg)
-            else:
-                # recursively download each dependency
-                for dependency in dependencies:
-                    msg = f"Recursively downloading dependency {dependency} of {package_name}."
-                    logger.debug(msg)
-
-                    # decrease recursion depth
-                    self.__recursion_limit -= 1
-
-                    # call main function to download dependency
-                    downloaded_dependency_binary_build_filenames = self.download(
-                        dependency,
-                        "latest",
-                        distribution_series,
-                        architecture,
-                        True,
+        logger.debug(
+            "Downloading package {} version {} for {} {}.",
+            package_name,
+            package_version,
+            lp_series.name,
+            lp_arch_series.architecture_tag,
+        )
+        package_binary_urls = list(binary_publishing_history.binaryFileUrls())
+        if cache_key is not None:
+            self.binary_url_cache.set(cache_key, package_binary_urls)
+        return package_binary_urls
+
+    def download(
+        self,
+        package_name: str,
+        package_version: str,
+        distribution_series: str,
+        architecture: str,
+        with_dependencies: bool,
+        recursion_limit: Optional[int] = None,
+        skip_installed: bool = False,
+    ) -> Annotated[
+        Optional[list[str]],
+        "List of downloaded package filenames or None if not found or none downloaded",
+    ]:
+        # the depth limit is per call, so concurrent downloads do not share mutable state
+        if recursion_limit is None:
+            recursion_limit = self.__recursion_limit
+        else:
+            recursion_limit = _validate_recursion_limit(recursion_limit)
+
+        lp_series, lp_arch_series = self._configure_arch_series(
+            distribution_series, architecture
+        )
+        self._scan_existing_binaries()
+
+        # dependencies are walked breadth first, one dependency depth level at a time
+        # the requested package is the only package of the first level
+        downloaded_binary_build_filenames = []
+        level = [(package_name, package_version)]
+        visited = {package_name}
+        depth = 0
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+            # on an interrupt, or a failed download or lookup, the queued downloads are cancelled,
+            # rather than the executor waiting for every one of them to finish before the error surfaces
+            try:
+                while level:
+                    # check whether the dependencies of this level are to be downloaded
+                    identify_dependencies = (
+                        with_dependencies and depth < recursion_limit
                     )
 
-                    # append any downloaded dependency filenames to main list
+                    # look up the binary urls of every package in the level
+                    # the launchpad client is not thread-safe, so lookups are made serially,
+                    # but each package's binaries start downloading while the rest of the level is looked up
+                    level_downloads = []
+                    for level_package_name, level_package_version in level:
+                        package_binary_urls = self.find_package_binary_urls(
+                            level_package_name,
+                            level_package_version,
+                            lp_series,
+                            lp_arch_series,
+                        )
+                        if package_binary_urls is None:
+                            # the requested package must exist, missing dependencies are only skipped
+                            if depth == 0:
+                                return None
+                            continue
+                        level_downloads.extend(
+                            executor.submit(
+                                self._download_package_binary_dependencies,
+                                package_binary_url,
+                                identify_dependencies,
+                            )
+                            for package_binary_url in package_binary_urls
+                        )
+
+                    self.binary_url_cache.save()
+
+                    # wait for every package binary of the level to download, and be parsed
+                    level_results = [
+                        level_download.result() for level_download in level_downloads
+                    ]
                     downloaded_binary_build_filenames.extend(
-                        downloaded_dependency_binary_build_filenames
-                    ) if downloaded_dependency_binary_build_filenames is not None else None
+                        binary_build_filename
+                        for binary_build_filename, _ in level_results
+                    )
 
-                    # restore recursion depth
-                    self.__recursion_limit += 1
+                    # check whether to download dependencies
+                    if not with_dependencies:
+                        break
+
+                    # check whether maximum recursion depth reached
+                    if not identify_dependencies:
+                        logger.opt(lazy=True).debug(
+                            "Maximum dependency recursion depth reached. Not downloading dependencies of {}.",
+                            lambda: ", ".join(name for name, _ in level),
+                        )
+                        break
+
+                    # the dependencies of the level's binaries become the next level
+                    self.dependency_cache.save()
+                    dependencies = set(
+                        chain.from_iterable(
+                            binary_dependencies
+                            for _, binary_dependencies in level_results
+                        )
+                    )
+                    # skip packages already downloaded, shared dependencies are only fetched once
+                    dependencies -= visited
+                    visited.update(dependencies)
+                    # the requested package is always downloaded, only its dependencies are skipped if installed
+                    if skip_installed:
+                        installed = self._installed_packages(dependencies, architecture)
+                        for dependency in installed:
+                            logger.debug(
+                                "Skipping dependency {} installed on this host.", dependency
+                            )
+                        dependencies -= installed
+                    for dependency in dependencies:
+                        logger.debug("Queueing dependency {} for download.", dependency)
+                    level = [(dependency, "latest") for dependency in dependencies]
+                    depth += 1
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
 
         # return list of downloaded binary build filenames or None
-        return (
-            downloaded_binary_build_filenames
-            if downloaded_binary_build_filenames
-            else None
-        )
+        return downloaded_binary_build_filenames or None